@@ -4,14 +4,33 @@ import os
 import json
 import getpass
 import sys
-import re
+import string
 import logging
+import functools
+import importlib.util
 
-try:
-    import keyring
-    from keyring.errors import NoKeyringError
-except ImportError:
-    keyring = None
+import json_config
+
+# Keyring username under which all credentials are stored as one JSON
+# object, so they can be read back with a single keyring lookup
+KEYRING_BUNDLE = 'credentials'
+
+# Characters accepted on either side of the '@' in an email address
+_EMAIL_LOCAL_CHARS = frozenset(string.ascii_letters + string.digits + '._%+-')
+_EMAIL_DOMAIN_CHARS = frozenset(string.ascii_letters + string.digits + '.-')
+
+@functools.lru_cache(maxsize=1)
+def _load_keyring():
+    """
+    Import keyring on first use, since it is slow to import
+
+    :return: keyring module, or None if it is not installed
+    """
+    try:
+        import keyring
+    except ImportError:
+        return None
+    return keyring
 
 class SecretsValidator:
     def __init__(self, config_path='secrets.json'):
@@ -31,6 +50,10 @@ class SecretsValidator:
         self.logger = logging.getLogger(__name__)
 
         self.config_path = config_path
+        # Set when the in-memory configuration differs from the file
+        self._dirty = False
+        # Credentials already in the keyring bundle, loaded on first store
+        self._keyring_bundle = None
         self.config = self._load_config()
 
     def _load_config(self):
@@ -40,9 +63,9 @@ class SecretsValidator:
         :return: Configuration dictionary
         """
         try:
-            with open(self.config_path, 'r') as f:
-                return json.load(f)
+            return json_config.load_config(self.config_path)
         except FileNotFoundError:
+            self._dirty = True
             return self._create_default_config()
         except json.JSONDecodeError:
             self.logger.error(f"{self.config_path} is not a valid JSON file.")
@@ -61,12 +84,15 @@ class SecretsValidator:
                 "two_factor_secret": "",
                 "max_files": 277,
                 "output_directory": "/mnt/f/GoogleTakeout",
-                "download_delay": 5
+                "download_delay": 5,
+                "concurrent_downloads": 4,
+                "connections_per_file": 1
             },
             "authentication": {
                 "job_id": "",
                 "last_downloaded_index": 0,
-                "last_token_refresh": None
+                "last_token_refresh": None,
+                "token_ttl_seconds": 3600
             },
             "proxy": {
                 "use_proxy": False,
@@ -89,8 +115,18 @@ class SecretsValidator:
         :param email: Email address to validate
         :return: Boolean indicating email validity
         """
-        email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(email_regex, email) is not None
+        at = email.find('@')
+        if at < 1:
+            return False
+
+        local, domain = email[:at], email[at + 1:]
+        dot = domain.rfind('.')
+        tld = domain[dot + 1:]
+        return (dot > 0
+                and len(tld) >= 2
+                and tld.isascii() and tld.isalpha()
+                and _EMAIL_LOCAL_CHARS.issuperset(local)
+                and _EMAIL_DOMAIN_CHARS.issuperset(domain[:dot]))
 
     def _store_credential(self, service, username, password):
         """
@@ -101,12 +137,19 @@ class SecretsValidator:
         :param password: Password
         """
         # Check if keyring is available
+        keyring = _load_keyring()
         if keyring:
             try:
-                keyring.set_password(service, username, password)
+                if self._keyring_bundle is None:
+                    existing = keyring.get_password(service, KEYRING_BUNDLE)
+                    self._keyring_bundle = json_config.loads(existing) if existing else {}
+                bundle = dict(self._keyring_bundle, **{username: password})
+                keyring.set_password(service, KEYRING_BUNDLE,
+                                     json_config.dumps(bundle).decode('utf-8'))
+                self._keyring_bundle = bundle
                 self.logger.info(f"Credential stored securely for {username}")
                 return True
-            except (NoKeyringError, Exception) as e:
+            except Exception as e:
                 self.logger.warning(f"Keyring storage failed: {e}")
         
         # Fallback to configuration file (less secure)
@@ -117,7 +160,7 @@ class SecretsValidator:
             elif service == 'google_takeout' and username == 'password':
                 self.config['google_takeout']['password'] = password
             
-            self.save_config()
+            self._dirty = True
             self.logger.warning("Credentials stored in configuration file (not recommended)")
             return False
         except Exception as e:
@@ -157,6 +200,7 @@ class SecretsValidator:
             
             if os.path.isdir(output_dir) or not os.path.exists(output_dir):
                 self.config['google_takeout']['output_directory'] = output_dir
+                self._dirty = True
                 break
             else:
                 print("Invalid directory. Please provide a valid path.")
@@ -171,22 +215,24 @@ class SecretsValidator:
                 delay_value = int(delay)
                 if delay_value > 0:
                     self.config['google_takeout']['download_delay'] = delay_value
+                    self._dirty = True
                     break
                 else:
                     print("Delay must be a positive integer.")
             except ValueError:
                 print("Invalid input. Please enter a number.")
 
-        # Save updated configuration
-        self.save_config()
+        # Save updated configuration once, after all prompts
+        if self._dirty:
+            self.save_config()
 
     def save_config(self):
         """
         Save updated configuration to file
         """
         try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            json_config.save_config(self.config, self.config_path, pretty=True)
+            self._dirty = False
             self.logger.info(f"Configuration saved to {self.config_path}")
         except Exception as e:
             self.logger.error(f"Error saving configuration: {e}")
@@ -230,8 +276,8 @@ def main():
     print("Google Takeout Download Configuration Wizard")
     print("-------------------------------------------")
 
-    # Check for keyring availability
-    if not keyring:
+    # Check for keyring availability without importing it yet
+    if importlib.util.find_spec('keyring') is None:
         print("\nWARNING: Keyring module not available.")
         print("Credentials will be stored in the configuration file.")
         print("This is NOT recommended for security reasons.\n")
@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
 import os
 import time
 import re
+import shlex
 from pathlib import Path
-from datetime import datetime
-import json
 import subprocess
+import sys
 import logging
+import logging.handlers
+import random
+import atexit
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import json_config
 
 def refresh_download_token():
     """
@@ -19,7 +30,8 @@ def refresh_download_token():
     try:
         # Run token retriever script
         result = subprocess.run(
-            ['python3', 'token_retriever.py'], 
+            # The current token was just rejected, so bypass the freshness check
+            ['python3', 'token_retriever.py', '--force'], 
             capture_output=True, 
             text=True, 
             check=True
@@ -30,49 +42,469 @@ def refresh_download_token():
         logging.error(f"Token refresh failed: {e.stderr}")
         return False
 
+# (connect, read) timeouts passed to every request
+REQUEST_TIMEOUT = (5, 60)
+
+# Bytes read from the response per write; archives are multi-GB
+CHUNK_SIZE = 1 << 20
+
+# Archive download URL; only i changes between files of one export
+_URL_TEMPLATE = ("https://takeout.google.com/settings/takeout/download?"
+                 "i={i}&j={j}&download=true&rapt={r}")
+
+# Chunks buffered between the network reader and the disk writer
+WRITE_QUEUE_DEPTH = 8
+
+# Archives smaller than this are never split across connections
+RANGED_MIN_SIZE = 64 << 20
+
+# Throttling responses, how often to retry them, and the longest wait
+RATE_LIMIT_STATUSES = (429, 503)
+RATE_LIMIT_ATTEMPTS = 5
+MAX_BACKOFF = 300
+
+# Leading bytes of every zip archive
+ZIP_MAGIC = b'PK'
+
+# Completed files between progress writes to secrets.json
+SAVE_INTERVAL = 8
+
+# rapt URL parameter inside a curl.txt argument
+_RE_RAPT = re.compile(r"rapt=([^&\s]+)")
+
+# Complete length at the end of a 206 Content-Range header
+_RE_CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+def save_config(config, path='secrets.json'):
+    """
+    Atomically write the configuration back to disk
+
+    :param config: Configuration dictionary
+    :param path: Path to secrets configuration file
+    """
+    # Indented like every other writer of secrets.json, which users edit by hand
+    json_config.save_config(config, path, pretty=True)
+
+def create_session(headers, cookies, pool_size=4):
+    """
+    Create a keep-alive session shared by all download workers
+
+    :param headers: Request headers from curl.txt
+    :param cookies: Cookies from curl.txt
+    :param pool_size: Maximum pooled connections to takeout.google.com
+    :return: Configured requests session
+    """
+    session = requests.Session()
+    retries = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+    session.mount('https://', HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retries
+    ))
+    session.headers.update(headers)
+    session.cookies.update(cookies)
+    return session
+
 def create_url(index, job_id, rapt):
     """Create download URL with exact working format."""
-    return (f"https://takeout.google.com/settings/takeout/download?"
-            f"i={index}&"
-            f"j={job_id}&"
-            f"download=true&"
-            f"rapt={rapt}")
+    return _URL_TEMPLATE.format(i=index, j=job_id, r=rapt)
 
 def parse_curl(curl_text):
     """Extract auth info from curl command."""
     if not 'takeout.google.com' in curl_text:
         raise ValueError("Not a Google Takeout curl command")
 
+    # Split like a shell would, so values quoted with shlex.quote (or by
+    # hand) come back intact
     headers = {}
-    for match in re.finditer(r"-H '([^:]+): ([^']+)'", curl_text):
-        name, value = match.groups()
-        headers[name] = value
+    cookie_text = None
+    rapt = None
+    tokens = iter(shlex.split(curl_text))
+    for token in tokens:
+        if token in ('-H', '--header'):
+            name, sep, value = next(tokens, '').partition(':')
+            if sep:
+                headers[name] = value.lstrip()
+        elif token in ('-b', '--cookie'):
+            jar = next(tokens, '')
+            if cookie_text is None:
+                cookie_text = jar
+        elif rapt is None:
+            match = _RE_RAPT.search(token)
+            if match:
+                rapt = match.group(1)
 
     cookies = {}
-    cookie_match = re.search(r"-b '([^']+)'", curl_text)
-    if cookie_match:
-        for pair in cookie_match.group(1).split('; '):
-            if '=' in pair:
-                name, value = pair.split('=', 1)
+    if cookie_text:
+        pos = 0
+        while True:
+            end = cookie_text.find('; ', pos)
+            pair = cookie_text[pos:] if end < 0 else cookie_text[pos:end]
+            name, sep, value = pair.partition('=')
+            if sep:
                 cookies[name] = value
+            if end < 0:
+                break
+            pos = end + 2
 
-    rapt_match = re.search(r'rapt=([^&\s\']+)', curl_text)
-    if not rapt_match:
+    if rapt is None:
         raise ValueError("No rapt token found")
     
-    return headers, cookies, rapt_match.group(1)
+    return headers, cookies, rapt
+
+def find_next_missing_index(directory, timestamp, start):
+    """
+    Find the first archive index from start that is not yet on disk
+
+    Only archives of this export (same batch timestamp) count, and only an
+    unbroken run of them: concurrent downloads finish out of order, so a
+    later archive being present says nothing about earlier ones.
+
+    :param directory: Output directory to scan
+    :param timestamp: Batch timestamp of the current export
+    :param start: Saved resume index
+    :return: First index at or after start with no completed archive
+    """
+    prefix = f"takeout-{timestamp}-"
+    present = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.startswith(prefix) or not name.endswith('.zip'):
+                continue
+            digits = name[len(prefix):-4]
+            if digits.isascii() and digits.isdigit():
+                present.add(int(digits))
+    while start in present:
+        start += 1
+    return start
+
+def preallocate(f, size):
+    """
+    Reserve disk space for a file before writing it
+
+    Best effort: filesystems that cannot preallocate (some /mnt drives
+    under WSL, for example) just grow the file as it is written.
+
+    :param f: File opened for binary writing
+    :param size: Expected final size in bytes
+    """
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, size)
+        else:
+            f.truncate(size)
+    except OSError as e:
+        logging.debug(f"Preallocation not supported: {e}")
+
+class DownloadCancelled(Exception):
+    """Raised in a worker when the run is stopping before its file is done"""
+
+def check_stop(stop):
+    """
+    Abort the current transfer if the run is shutting down
+
+    :param stop: threading.Event set when the run stops, or None
+    """
+    if stop is not None and stop.is_set():
+        raise DownloadCancelled("Download cancelled")
+
+def copy_pipelined(src, dst, stop=None):
+    """
+    Copy a stream to a file with reading and writing on separate threads
+
+    Socket reads and disk writes both release the GIL, so a slow disk no
+    longer stalls the connection while a chunk is being written.
+
+    :param src: Readable binary stream
+    :param dst: Writable binary file
+    :param stop: Optional threading.Event that aborts the copy when set
+    """
+    chunks = queue.Queue(maxsize=WRITE_QUEUE_DEPTH)
+    errors = []
+
+    def write_chunks():
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                dst.write(chunk)
+        except BaseException as e:
+            errors.append(e)
+            # Keep draining so the reader never blocks on a full queue
+            while chunks.get() is not None:
+                pass
+
+    writer = threading.Thread(target=write_chunks, daemon=True)
+    writer.start()
+    try:
+        while not errors:
+            check_stop(stop)
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.put(chunk)
+    finally:
+        chunks.put(None)
+        writer.join()
+
+    if errors:
+        raise errors[0]
+
+def write_at(src, fd, offset, end, stop=None):
+    """
+    Copy a stream into a byte range of a file
+
+    :param src: Readable binary stream
+    :param fd: File descriptor opened for writing
+    :param offset: First byte position to write
+    :param end: Position to stop at (exclusive)
+    :param stop: Optional threading.Event that aborts the copy when set
+    :return: Number of bytes written
+    """
+    start = offset
+    while offset < end:
+        check_stop(stop)
+        chunk = src.read(min(CHUNK_SIZE, end - offset))
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+    return offset - start
+
+def download_ranges(session, url, response, magic, fd, total_size, connections,
+                    stop=None):
+    """
+    Download one archive over several connections using Range requests
+
+    The already open response supplies the first span; the remaining
+    spans are fetched concurrently and written in place with pwrite.
+
+    :param session: Authenticated requests session
+    :param url: Download URL for this archive
+    :param response: Open streaming response for the whole archive
+    :param magic: Bytes already read from the start of response
+    :param fd: File descriptor of the preallocated temp file
+    :param total_size: Archive size in bytes
+    :param connections: Number of connections to split the archive over
+    :param stop: Optional threading.Event that aborts the download when set
+    :return: Total number of bytes written
+    """
+    span = -(-total_size // connections)
+    ranges = [(start, min(start + span, total_size))
+              for start in range(span, total_size, span)]
+
+    def fetch(start, end):
+        headers = {'Range': f"bytes={start}-{end - 1}"}
+        with session.get(url, headers=headers, stream=True,
+                         timeout=REQUEST_TIMEOUT) as part:
+            if part.status_code != 206:
+                raise IOError(f"Range request failed with status {part.status_code}")
+            part.raw.decode_content = True
+            return write_at(part.raw, fd, start, end, stop)
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(fetch, start, end) for start, end in ranges]
+        os.pwrite(fd, magic, 0)
+        written = len(magic) + write_at(response.raw, fd, len(magic), min(span, total_size), stop)
+        return written + sum(future.result() for future in futures)
+
+def rate_limit_delay(response, attempt, base_delay):
+    """
+    Work out how long to wait before retrying a throttled request
+
+    :param response: Throttled response
+    :param attempt: Zero-based retry attempt
+    :param base_delay: Base back-off delay in seconds
+    :return: Seconds to wait
+    """
+    # The session's urllib3 Retry already honours Retry-After (uncapped) up
+    # to five times before this loop sees a 429/503, so the waits stack;
+    # cap ours so a hostile header can't park a worker for hours
+    retry_after = response.headers.get('retry-after', '')
+    if retry_after.isdigit():
+        return min(MAX_BACKOFF, float(retry_after))
+    return min(MAX_BACKOFF, base_delay * 2 ** attempt) + random.uniform(0, base_delay)
+
+class AuthenticationError(Exception):
+    """Raised when Google returns an error page instead of an archive"""
+
+def request_archive(session, url, index, download_delay, resume_from=0):
+    """
+    Request an archive, backing off while Google rate-limits
+
+    :param session: Authenticated requests session
+    :param url: Download URL for this archive
+    :param index: Archive index
+    :param download_delay: Base back-off delay in seconds
+    :param resume_from: Byte offset to resume from, or 0 for the whole file
+    :return: Open streaming response
+    """
+    headers = {'Range': f"bytes={resume_from}-"} if resume_from else None
+
+    # Only wait when Google actually asks us to slow down
+    for attempt in range(RATE_LIMIT_ATTEMPTS):
+        response = session.get(url, headers=headers, stream=True,
+                               timeout=REQUEST_TIMEOUT)
+        if response.status_code not in RATE_LIMIT_STATUSES:
+            break
+        response.close()
+        if attempt == RATE_LIMIT_ATTEMPTS - 1:
+            # Out of attempts; the caller reports it, no point waiting first
+            break
+        delay = rate_limit_delay(response, attempt, download_delay)
+        logging.warning(f"Rate limited on file {index}, retrying in {delay:.0f} seconds")
+        time.sleep(delay)
+
+    return response
+
+def download_file(session, url, outdir, index, timestamp, download_delay=0,
+                  connections=1, stop=None):
+    """
+    Download a single Takeout archive into the output directory
+
+    A partial download left by an earlier run is resumed with a Range
+    request when the server supports it.
+
+    :param session: Authenticated requests session
+    :param url: Download URL for this archive
+    :param outdir: Output directory Path
+    :param index: Archive index
+    :param timestamp: Batch timestamp shared by every file in this run
+    :param download_delay: Base back-off delay when Google rate-limits
+    :param connections: Connections to split large archives over
+    :param stop: Optional threading.Event set when the run is stopping
+    :return: Path of the downloaded archive
+    """
+    outfile = outdir / f"takeout-{timestamp}-{index:03d}.zip"
+    # Archives only appear under their final name once complete, and resume
+    # restarts at the first gap, so later indices may already be done
+    if outfile.exists():
+        logging.info(f"File {index} already downloaded, skipping")
+        return outfile
+
+    # The batch timestamp belongs to one export job, so a part file left by
+    # a different export is never mistaken for a prefix of this archive.
+    # Part files are only ever appended to, so their length is always the
+    # number of bytes received.
+    partfile = outdir / f"{outfile.name}.part"
+    resume_from = partfile.stat().st_size if partfile.exists() else 0
+
+    logging.info(f"Downloading file {index}...")
+    response = request_archive(session, url, index, download_delay, resume_from)
+    if resume_from and response.status_code == 416:
+        # The partial file is not a prefix of this archive; start over
+        response.close()
+        partfile.unlink()
+        resume_from = 0
+        response = request_archive(session, url, index, download_delay)
+
+    with response:
+        if response.status_code in RATE_LIMIT_STATUSES:
+            raise IOError(f"Still rate limited after {RATE_LIMIT_ATTEMPTS} attempts")
+
+        if response.status_code == 404:
+            raise FileNotFoundError("File not found - archive may not be ready")
+
+        resumed = bool(resume_from) and response.status_code == 206
+        if not resumed and response.status_code != 200:
+            raise AuthenticationError(f"Status {response.status_code}")
+
+        response.raw.decode_content = True
+        total_size = int(response.headers.get('content-length', 0))
+        if resumed:
+            logging.info(f"Resuming file {index} from byte {resume_from:,}")
+            # Content-Range carries the full length even when the body's
+            # length is unknown; without either, skip the size check
+            range_match = _RE_CONTENT_RANGE.match(response.headers.get('content-range', ''))
+            if range_match:
+                total_size = int(range_match.group(1))
+            elif total_size:
+                total_size += resume_from
+            magic = b''
+        else:
+            # Every zip starts with the PK signature; anything else is an
+            # error or login page, whatever its content-type says
+            magic = response.raw.read(len(ZIP_MAGIC))
+            if magic != ZIP_MAGIC:
+                raise AuthenticationError("Got a page instead of an archive (auth failed)")
+
+        if total_size:
+            logging.info(f"Size: {total_size:,} bytes")
+
+        logging.info(f"Saving to {outfile.name}")
+        ranged = (not resumed
+                  and connections > 1
+                  and total_size >= RANGED_MIN_SIZE
+                  and response.headers.get('accept-ranges') == 'bytes'
+                  and hasattr(os, 'pwrite'))
+        # Ranged downloads fill a preallocated file out of order, so their
+        # length says nothing about progress; keep them apart from part
+        # files and never resume them
+        tmpfile = outdir / f"{outfile.name}.ranged" if ranged else partfile
+        keep_partial = False
+        try:
+            with open(tmpfile, 'ab' if resumed else 'wb', buffering=CHUNK_SIZE) as f:
+                try:
+                    if ranged:
+                        # Reserve the whole archive up front to avoid fragmentation
+                        preallocate(f, total_size)
+                        written = download_ranges(session, url, response, magic,
+                                                  f.fileno(), total_size, connections,
+                                                  stop)
+                    else:
+                        # Copy straight from the raw stream rather than through
+                        # the per-chunk iter_content generator
+                        f.write(magic)
+                        copy_pipelined(response.raw, f, stop)
+                        written = f.tell()
+                except BaseException:
+                    # A sequential download is a valid prefix of the archive,
+                    # including on Ctrl-C; keep it for next time
+                    keep_partial = not ranged
+                    raise
+
+                # Finished archives are not read again; keep them from
+                # crowding everything else out of the page cache
+                if hasattr(os, 'posix_fadvise'):
+                    f.flush()
+                    os.fdatasync(f.fileno())
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+            # Verify size if we got content-length
+            if total_size and written != total_size:
+                raise IOError(f"Size mismatch for file {index}")
+
+            tmpfile.rename(outfile)
+        except BaseException:
+            if not keep_partial and tmpfile.exists():
+                tmpfile.unlink()
+            raise
+
+    return outfile
 
 def main():
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO, 
-        format='%(asctime)s - %(levelname)s - %(message)s'
+    # Configure logging. Progress records are buffered and written in
+    # batches; warnings and errors flush the buffer immediately.
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    progress = logging.handlers.MemoryHandler(
+        16, flushLevel=logging.WARNING, target=console
     )
+    logging.basicConfig(level=logging.INFO, handlers=[progress])
 
     # Read secrets configuration
     try:
-        with open('secrets.json', 'r') as f:
-            config = json.load(f)
+        config = json_config.load_config('secrets.json')
     except FileNotFoundError:
         logging.error("secrets.json not found")
         return 1
@@ -101,12 +533,6 @@ def main():
             logging.error(f"Persistent error parsing curl.txt: {e}")
             return 1
 
-    # Setup session
-    session = requests.Session()
-    session.headers.update(headers)
-    session.cookies.update(cookies)
-    session.timeout = 30  # 30 second timeout
-
     # Create output directory
     outdir = Path(config['google_takeout'].get('output_directory', '/mnt/f/GoogleTakeout'))
     outdir.mkdir(parents=True, exist_ok=True)
@@ -115,85 +541,125 @@ def main():
     start = config['authentication'].get('last_downloaded_index', 0)
     max_files = config['google_takeout'].get('max_files', 277)
 
-    print(f"Starting from index {start}")
-
     # Download files
     job_id = config['authentication'].get('job_id', 'unknown')
-    download_delay = config['google_takeout'].get('download_delay', 5)
 
-    for i in range(start, max_files):
-        print(f"\nDownloading file {i}...")
-        
-        url = create_url(i, job_id, rapt)
-        try:
-            response = session.get(url, stream=True)
-            
-            if response.status_code == 404:
-                print("File not found - archive may not be ready")
-                return 1
+    # One UTC timestamp per export, matching Google's own names. It is kept
+    # across runs of the same job so resumed archives share the batch name.
+    auth = config['authentication']
+    timestamp = auth.get('batch_timestamp')
+    if not timestamp or auth.get('batch_job_id') != job_id:
+        timestamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        auth['batch_timestamp'] = timestamp
+        auth['batch_job_id'] = job_id
+        save_config(config)
 
-            if response.status_code != 200:
-                print(f"Error: Status {response.status_code}")
-                # Attempt to refresh token
-                if not refresh_download_token():
-                    print("Failed to refresh download token")
-                    return 1
-                continue
+    # Progress is saved in batches, so archives on disk may be ahead of it
+    start = find_next_missing_index(outdir, timestamp, start)
 
-            if 'html' in response.headers.get('content-type', ''):
-                print("Error: Got HTML instead of file (auth failed)")
-                # Attempt to refresh token
-                if not refresh_download_token():
-                    print("Failed to refresh download token")
-                    return 1
-                continue
+    logging.info(f"Starting from index {start}")
+
+    download_delay = config['google_takeout'].get('download_delay', 5)
+    workers = config['google_takeout'].get('concurrent_downloads', 4)
+    connections = config['google_takeout'].get('connections_per_file', 1)
+
+    # Progress is only written every SAVE_INTERVAL files, so make sure the
+    # latest index is persisted however the run ends
+    atexit.register(save_config, config)
 
-            # Create unique temp filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            outfile = outdir / f"takeout-{timestamp}Z-{i:03d}.zip"
-            tmpfile = outdir / f"tmp_{timestamp}_{i:03d}.zip"
-            
-            # Get expected size
-            total_size = int(response.headers.get('content-length', 0))
-            if total_size:
-                print(f"Size: {total_size:,} bytes")
-            
-            print(f"Saving to {outfile.name}")
+    refreshed_at = None
+    while True:
+        # Downloads are network bound, so a small bounded pool overlaps the
+        # transfers. Results are consumed in index order so that
+        # last_downloaded_index only ever advances over completed files.
+        # The session closes its pooled connections once the workers finish.
+        indices = range(start, max_files)
+        stop = threading.Event()
+        session = create_session(headers, cookies, pool_size=workers * connections)
+        with session, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(download_file, session, create_url(i, job_id, rapt),
+                                outdir, i, timestamp, download_delay, connections, stop)
+                for i in indices
+            ]
             try:
-                with open(tmpfile, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                
-                # Verify size if we got content-length
-                if total_size and tmpfile.stat().st_size != total_size:
-                    print("Error: Size mismatch")
-                    tmpfile.unlink()
-                    return 1
-                    
-                tmpfile.rename(outfile)
-                
-                # Update last downloaded index
-                config['authentication']['last_downloaded_index'] = i + 1
-                with open('secrets.json', 'w') as f:
-                    json.dump(config, f, indent=4)
-                
-            except:
-                if tmpfile.exists():
-                    tmpfile.unlink()
+                for i, future in zip(indices, futures):
+                    future.result()
+
+                    # Update last downloaded index
+                    config['authentication']['last_downloaded_index'] = i + 1
+                    progress.flush()
+                    if (i + 1) % SAVE_INTERVAL == 0 or i == max_files - 1:
+                        save_config(config)
+            except AuthenticationError as e:
+                # Every queued download shares the rejected session
+                _cancel(futures)
+                logging.error(f"Error: {e}")
+                failed_at = i
+            except requests.Timeout:
+                logging.error("Error: Request timed out")
+                _cancel(futures, stop)
+                return 1
+            except (requests.RequestException, urllib3.exceptions.HTTPError, IOError) as e:
+                logging.error(f"Error: {e}")
+                _cancel(futures, stop)
+                return 1
+            except BaseException:
+                # Ctrl-C: leaving the executor waits for its workers, so make
+                # the running transfers stop at their next chunk
+                _cancel(futures, stop)
                 raise
-                
-        except requests.Timeout:
-            print("Error: Request timed out")
+            else:
+                return 0
+
+        # Refresh the token once per rejected archive, then start a fresh
+        # session from that archive on
+        if failed_at == refreshed_at:
+            logging.error("Download still rejected after refreshing the token")
             return 1
-        except requests.RequestException as e:
-            print(f"Error: {e}")
+        save_config(config)
+        if not refresh_download_token():
+            logging.error("Failed to refresh download token")
             return 1
-            
-        print(f"Waiting {download_delay} seconds...")
-        time.sleep(download_delay)
-    
-    return 0
+        try:
+            with open('curl.txt') as f:
+                headers, cookies, rapt = parse_curl(f.read())
+        except (ValueError, IOError) as e:
+            logging.error(f"Error parsing refreshed curl.txt: {e}")
+            return 1
+
+        # The retriever rewrote secrets.json with the new job id and refresh
+        # time; pick those up rather than saving stale values over them.
+        # The config dict is updated in place because the atexit hook
+        # holds on to it.
+        progress_keys = ('last_downloaded_index', 'batch_timestamp', 'batch_job_id')
+        progress_state = {key: config['authentication'][key]
+                          for key in progress_keys if key in config['authentication']}
+        try:
+            fresh = json_config.load_config('secrets.json')
+        except (ValueError, IOError) as e:
+            logging.error(f"Error reloading secrets.json: {e}")
+            return 1
+        config.clear()
+        config.update(fresh)
+        config['authentication'].update(progress_state)
+        job_id = config['authentication'].get('job_id', 'unknown')
+
+        refreshed_at = failed_at
+        start = find_next_missing_index(outdir, timestamp, failed_at)
+
+def _cancel(futures, stop=None):
+    """
+    Cancel downloads that have not started yet
+
+    :param futures: Submitted download futures
+    :param stop: Event to set so running downloads abort too, keeping
+                 their partial files for the next run
+    """
+    if stop is not None:
+        stop.set()
+    for future in futures:
+        future.cancel()
 
 if __name__ == "__main__":
     exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+JSON helpers shared by the Takeout scripts
+
+Uses orjson when it is installed and falls back to the standard library.
+"""
+
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def loads(data):
+    """
+    Parse JSON text or bytes
+
+    :param data: JSON document
+    :return: Parsed object
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj, pretty=False):
+    """
+    Serialize an object to UTF-8 encoded JSON
+
+    :param obj: Object to serialize
+    :param pretty: Indent the output for hand editing
+    :return: JSON bytes
+    """
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(obj, indent=2 if pretty else None).encode('utf-8')
+
+def load_config(path):
+    """
+    Load a JSON configuration file
+
+    :param path: Path to configuration file
+    :return: Configuration dictionary
+    """
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+def write_atomic(path, data, mode=None):
+    """
+    Replace a file's contents so readers never see a partial write
+
+    :param path: Destination path
+    :param data: Bytes to write
+    :param mode: Permissions of the new file; by default those of the file
+                 being replaced, or owner-only for a new file, since these
+                 files hold credentials and session cookies
+    """
+    if mode is None:
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o600
+
+    tmp_path = f"{path}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with os.fdopen(fd, 'wb') as f:
+            # A leftover temp file keeps whatever mode it was created with
+            os.chmod(tmp_path, mode)
+            f.write(data)
+            # Make the data durable before the rename can be
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def save_config(config, path, pretty=False):
+    """
+    Atomically write a configuration file
+
+    :param config: Configuration dictionary
+    :param path: Path to configuration file
+    :param pretty: Indent the output for hand editing
+    """
+    write_atomic(path, dumps(config, pretty))
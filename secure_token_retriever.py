@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
-import json
 import time
 import logging
 from typing import Dict, Optional, Any
@@ -18,7 +18,20 @@ from selenium.common.exceptions import (
     WebDriverException, 
     NoSuchElementException
 )
-from webdriver_manager.chrome import ChromeDriverManager
+
+import json_config
+from configure_secrets import KEYRING_BUNDLE
+from token_retriever import build_curl_command
+
+# Takeout job id and rapt token in the download URL
+_JOB_ID_RE = re.compile(r'j=([^&]+)')
+_RAPT_RE = re.compile(r'rapt=([^&]+)')
+
+# Collect every named meta tag in one round trip instead of 1 + 2N RPCs
+_META_SCRIPT = (
+    "return Array.from(document.querySelectorAll('meta[name]'))"
+    ".map(m => [m.name, m.getAttribute('content') || m.content]);"
+)
 
 class SecureTokenRetriever:
     def __init__(self, 
@@ -30,29 +43,45 @@ class SecureTokenRetriever:
         :param config_path: Path to configuration file
         :param log_path: Path for logging
         """
-        # Configure comprehensive logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_path),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        # Configure comprehensive logging, once per process
+        if not logging.getLogger().handlers:
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(levelname)s - %(message)s',
+                handlers=[
+                    logging.FileHandler(log_path),
+                    logging.StreamHandler(sys.stdout)
+                ]
+            )
         self.logger = logging.getLogger(__name__)
 
         # Load configuration
         try:
-            with open(config_path, 'r') as f:
-                self.config = json.load(f)
+            self.config = json_config.load_config(config_path)
         except FileNotFoundError:
             self.logger.error(f"Configuration file not found: {config_path}")
             raise
 
         # Secure credential retrieval
-        self.email = self._get_credential('email')
-        self.password = self._get_credential('password')
-        self.two_factor_secret = self._get_credential('two_factor_secret')
+        self._credentials = self.config.get('google_takeout', {})
+        if not self._credentials:
+            self.logger.error("No google_takeout credentials found in configuration")
+        self._keyring_bundle = self._load_keyring_bundle()
+        for key in ('email', 'password', 'two_factor_secret'):
+            setattr(self, key, self._get_credential(key))
+
+    def _load_keyring_bundle(self) -> Optional[Dict[str, str]]:
+        """
+        Read all credentials from the keyring with a single lookup
+
+        :return: Credential dictionary, or None if no bundle is stored
+        """
+        try:
+            bundle = keyring.get_password('google_takeout', KEYRING_BUNDLE)
+            return json_config.loads(bundle) if bundle else None
+        except Exception as e:
+            self.logger.warning(f"Keyring retrieval failed for credentials: {e}")
+            return None
 
     def _get_credential(self, key: str) -> Optional[str]:
         """
@@ -62,20 +91,18 @@ class SecureTokenRetriever:
         :param key: Credential key to retrieve
         :return: Credential value
         """
+        credential = (self._keyring_bundle or {}).get(key)
         try:
-            # Try keyring first
-            credential = keyring.get_password('google_takeout', key)
-            if credential:
-                return credential
+            # Entries stored one per key predate the bundle and may still
+            # hold anything the bundle lacks
+            if not credential:
+                credential = keyring.get_password('google_takeout', key)
         except Exception as e:
             self.logger.warning(f"Keyring retrieval failed for {key}: {e}")
+            credential = None
 
         # Fallback to config file
-        try:
-            return self.config['google_takeout'].get(key)
-        except KeyError:
-            self.logger.error(f"No {key} found in configuration")
-            return None
+        return credential or self._credentials.get(key)
 
     def _setup_webdriver(self) -> webdriver.Chrome:
         """
@@ -99,11 +126,12 @@ class SecureTokenRetriever:
             "Chrome/91.0.4472.124 Safari/537.36"
         )
 
+        # Selenium Manager resolves the driver unless one is pinned in config
+        driver_path = self.config.get('chromedriver_path')
         try:
-            return webdriver.Chrome(
-                service=Service(ChromeDriverManager().install()), 
-                options=chrome_options
-            )
+            if driver_path:
+                return webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+            return webdriver.Chrome(options=chrome_options)
         except WebDriverException as e:
             self.logger.error(f"WebDriver setup failed: {e}")
             raise
@@ -180,22 +208,18 @@ class SecureTokenRetriever:
 
             # Extract download parameters
             current_url = driver.current_url
-            job_id_match = re.search(r'j=([^&]+)', current_url)
+            job_id_match = _JOB_ID_RE.search(current_url)
             job_id = job_id_match.group(1) if job_id_match else None
+            rapt_match = _RAPT_RE.search(current_url)
+            rapt = rapt_match.group(1) if rapt_match else None
 
-            # Capture headers and cookies
-            headers = {h.get_attribute('name'): h.get_attribute('value') 
-                       for h in driver.find_elements(By.XPATH, "//meta[@name]")}
-            
-            # Construct cURL command
-            curl_command = (
-                f"curl 'https://takeout.google.com/settings/takeout/download?i=0&j={job_id}&download=true' "
-                + " ".join([f"-H '{k}: {v}'" for k, v in headers.items()])
-            )
+            # Capture headers and cookies; download_takeout replays the
+            # browser session from them
+            headers = dict(driver.execute_script(_META_SCRIPT))
+            curl_command = build_curl_command(job_id, rapt, headers, driver.get_cookies())
 
             # Save cURL command
-            with open('curl.txt', 'w') as f:
-                f.write(curl_command)
+            json_config.write_atomic('curl.txt', curl_command.encode('utf-8'), mode=0o600)
 
             # Update configuration
             self.config['authentication']['job_id'] = job_id
@@ -218,8 +242,7 @@ class SecureTokenRetriever:
         :param config_path: Path to save configuration
         """
         try:
-            with open(config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            json_config.save_config(self.config, config_path, pretty=True)
             self.logger.info(f"Configuration saved to {config_path}")
         except Exception as e:
             self.logger.error(f"Configuration save failed: {e}")
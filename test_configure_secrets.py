@@ -0,0 +1,104 @@
+import re
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+
+import json_config
+from configure_secrets import SecretsValidator
+
+@pytest.fixture
+def validator(tmp_path):
+    """Create a validator backed by a fresh default configuration"""
+    return SecretsValidator(config_path=str(tmp_path / 'secrets.json'))
+
+@pytest.mark.parametrize('email', [
+    'user@example.com',
+    'first.last+tag@mail.example.co.uk',
+    'a%b_c-d@sub-domain.io',
+    '',
+    '@example.com',
+    'user@',
+    'user@example',
+    'user@.com',
+    'user@example.c',
+    'user@example.c0m',
+    'user@@example.com',
+    'us er@example.com',
+    'user@exa_mple.com',
+    'usér@example.com',
+    'user@example.cöm',
+])
+def test_email_validation_matches_regex(validator, email):
+    """Hand-written validator accepts exactly what the original regex did"""
+    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    expected = re.match(email_regex, email) is not None
+    assert validator._validate_email(email) == expected
+
+def test_load_config_sees_rewrites(tmp_path):
+    """Each load returns its own copy and reflects rewrites"""
+    config_path = tmp_path / 'secrets.json'
+    config_path.write_text('{"google_takeout": {"email": "a@example.com"}}')
+
+    first = SecretsValidator(config_path=str(config_path))
+    first.config['google_takeout']['email'] = 'changed@example.com'
+    second = SecretsValidator(config_path=str(config_path))
+    assert second.config['google_takeout']['email'] == 'a@example.com'
+
+    config_path.write_text('{"google_takeout": {"email": "rewritten@example.com"}}')
+    third = SecretsValidator(config_path=str(config_path))
+    assert third.config['google_takeout']['email'] == 'rewritten@example.com'
+
+def test_write_atomic_is_owner_only(tmp_path):
+    """Files holding session cookies are never readable by other users"""
+    path = tmp_path / 'curl.txt'
+    path.write_text('old')
+    path.chmod(0o644)
+    json_config.write_atomic(str(path), b'new', mode=0o600)
+    assert path.read_bytes() == b'new'
+    assert path.stat().st_mode & 0o777 == 0o600
+
+def test_save_config_keeps_permissions(tmp_path):
+    """Rewriting secrets.json keeps its mode; a new one is owner-only"""
+    path = tmp_path / 'secrets.json'
+    json_config.save_config({'a': 1}, str(path))
+    assert path.stat().st_mode & 0o777 == 0o600
+
+    path.chmod(0o640)
+    json_config.save_config({'a': 2}, str(path))
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert json.loads(path.read_text()) == {'a': 2}
+    assert [p.name for p in tmp_path.iterdir()] == ['secrets.json']
+
+@patch('configure_secrets._load_keyring', return_value=None)
+@patch('getpass.getpass', return_value='secret')
+def test_wizard_saves_once(mock_getpass, mock_keyring, validator, tmp_path):
+    """Credentials and settings from one wizard run are written in a single save"""
+    answers = iter(['user@example.com', '', str(tmp_path), '7'])
+    with patch('builtins.input', lambda prompt: next(answers)), \
+         patch('json_config.save_config', wraps=json_config.save_config) as save:
+        validator.prompt_for_missing_info()
+
+    assert save.call_count == 1
+    with open(validator.config_path) as f:
+        saved = json.load(f)
+    assert saved['google_takeout']['email'] == 'user@example.com'
+    assert saved['google_takeout']['password'] == 'secret'
+    assert saved['google_takeout']['download_delay'] == 7
+
+def test_credentials_stored_as_one_keyring_bundle(validator):
+    """Each stored credential is merged into a single keyring entry"""
+    store = {}
+    fake_keyring = MagicMock()
+    fake_keyring.get_password.side_effect = lambda service, name: store.get((service, name))
+    fake_keyring.set_password.side_effect = \
+        lambda service, name, value: store.__setitem__((service, name), value)
+
+    with patch('configure_secrets._load_keyring', return_value=fake_keyring):
+        assert validator._store_credential('google_takeout', 'email', 'a@example.com')
+        assert validator._store_credential('google_takeout', 'password', 'secret')
+
+    assert list(store) == [('google_takeout', 'credentials')]
+    assert json.loads(store['google_takeout', 'credentials']) == {
+        'email': 'a@example.com',
+        'password': 'secret'
+    }
@@ -1,8 +1,56 @@
 #!/usr/bin/env python3
 
+import io
+import os
+import json
+import time
+import signal
+import threading
+import tempfile
 import unittest
 from pathlib import Path
-from download_takeout import create_url, parse_curl
+from unittest.mock import MagicMock, patch
+from download_takeout import (
+    MAX_BACKOFF, AuthenticationError, DownloadCancelled, copy_pipelined, create_url, download_file,
+    find_next_missing_index, main, parse_curl, save_config
+)
+
+def fake_response(body=b'PK\x03\x04data', status=200, content_type='application/zip'):
+    """Build a mock streaming response serving body."""
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.status_code = status
+    response.headers = {'content-type': content_type, 'content-length': str(len(body))}
+    response.raw = io.BytesIO(body)
+    return response
+
+class DroppedStream(io.BytesIO):
+    """Stream that loses its connection once body has been read."""
+    def read(self, size=-1):
+        chunk = super().read(size)
+        if not chunk:
+            raise ConnectionError("reset")
+        return chunk
+
+class SlowStream:
+    """Archive stream that trickles data, for interrupting downloads."""
+    def __init__(self, stop_after=None, stop=None, reads=100):
+        self.stop_after = stop_after
+        self.stop = stop
+        self.reads = reads
+
+    def read(self, size=-1):
+        if size == 2:
+            return b'PK'
+        self.reads -= 1
+        if self.stop_after is not None:
+            self.stop_after -= 1
+            if self.stop_after == 0:
+                self.stop.set()
+        if self.reads < 0:
+            return b''
+        time.sleep(0.05)
+        return b'x' * 16
 
 class TestDownloader(unittest.TestCase):
     def test_working_url_format(self):
@@ -25,6 +73,15 @@ class TestDownloader(unittest.TestCase):
         self.assertEqual(cookies['cookie1'], 'value1')
         self.assertEqual(rapt, 'test-rapt')
 
+    def test_shell_quoted_values(self):
+        """Test values quoted with shlex.quote parse back unchanged."""
+        curl = ("curl 'https://takeout.google.com/download?j=1&rapt=r' "
+                "-H 'X-Note: it'\"'\"'s' -b 'a=1; b=2'")
+        headers, cookies, rapt = parse_curl(curl)
+        self.assertEqual(headers['X-Note'], "it's")
+        self.assertEqual(cookies, {'a': '1', 'b': '2'})
+        self.assertEqual(rapt, 'r')
+
     def test_missing_rapt(self):
         """Test curl command without rapt token."""
         curl = """curl 'https://takeout.google.com/' -H 'Accept: test' -b 'cookie=test'"""
@@ -43,6 +100,298 @@ class TestDownloader(unittest.TestCase):
         filename = f"takeout-{datetime.now().strftime('%Y%m%d')}T000000Z-042.zip"
         self.assertRegex(filename, r'takeout-\d{8}T\d{6}Z-\d{3}\.zip')
 
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outdir = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_download_writes_archive(self):
+        """Test a successful download is renamed into place."""
+        session = MagicMock()
+        session.get.return_value = fake_response()
+        outfile = download_file(session, "url", self.outdir, 7, "20240101T000000Z")
+        self.assertEqual(outfile.name, 'takeout-20240101T000000Z-007.zip')
+        self.assertEqual(outfile.read_bytes(), b'PK\x03\x04data')
+        self.assertEqual([p.name for p in self.outdir.iterdir()], [outfile.name])
+
+    def test_completed_archive_is_not_downloaded_again(self):
+        """Test an archive already on disk is skipped without a request."""
+        outfile = self.outdir / 'takeout-20240101T000000Z-002.zip'
+        outfile.write_bytes(b'PKdone')
+        session = MagicMock()
+        self.assertEqual(download_file(session, "url", self.outdir, 2, "20240101T000000Z"),
+                         outfile)
+        session.get.assert_not_called()
+        self.assertEqual(outfile.read_bytes(), b'PKdone')
+
+    def test_html_response_is_auth_failure(self):
+        """Test an HTML page instead of an archive raises AuthenticationError."""
+        session = MagicMock()
+        session.get.return_value = fake_response(b'<html></html>', content_type='text/html')
+        with self.assertRaises(AuthenticationError):
+            download_file(session, "url", self.outdir, 0, "20240101T000000Z")
+        self.assertEqual(list(self.outdir.iterdir()), [])
+
+    def test_non_zip_body_is_auth_failure(self):
+        """Test a non-archive body is rejected even with a zip content-type."""
+        session = MagicMock()
+        session.get.return_value = fake_response(b'Sign in to continue')
+        with self.assertRaises(AuthenticationError):
+            download_file(session, "url", self.outdir, 0, "20240101T000000Z")
+        self.assertEqual(list(self.outdir.iterdir()), [])
+
+    def test_truncated_download_is_discarded(self):
+        """Test a body shorter than content-length fails and leaves no file."""
+        session = MagicMock()
+        response = fake_response()
+        response.headers['content-length'] = '1000'
+        session.get.return_value = response
+        with self.assertRaises(IOError):
+            download_file(session, "url", self.outdir, 0, "20240101T000000Z")
+        self.assertEqual(list(self.outdir.iterdir()), [])
+
+    def test_partial_download_is_resumed(self):
+        """Test an existing .part file is continued with a Range request."""
+        body = b'PK\x03\x04' + b'x' * 100
+        (self.outdir / 'takeout-20240101T000000Z-003.zip.part').write_bytes(body[:40])
+        session = MagicMock()
+        session.get.return_value = fake_response(body[40:], status=206)
+        outfile = download_file(session, "url", self.outdir, 3, "20240101T000000Z")
+        self.assertEqual(session.get.call_args.kwargs['headers'], {'Range': 'bytes=40-'})
+        self.assertEqual(outfile.read_bytes(), body)
+        self.assertEqual([p.name for p in self.outdir.iterdir()], [outfile.name])
+
+    def test_resume_without_content_length_uses_content_range(self):
+        """Test a chunked 206 is sized from Content-Range, not the resume offset."""
+        body = b'PK\x03\x04' + b'x' * 100
+        (self.outdir / 'takeout-20240101T000000Z-003.zip.part').write_bytes(body[:40])
+        response = fake_response(body[40:], status=206)
+        response.headers = {'content-range': f'bytes 40-{len(body) - 1}/{len(body)}'}
+        session = MagicMock()
+        session.get.return_value = response
+        outfile = download_file(session, "url", self.outdir, 3, "20240101T000000Z")
+        self.assertEqual(outfile.read_bytes(), body)
+
+    def test_resume_of_unknown_length_keeps_data(self):
+        """Test a 206 with no length at all skips the size check."""
+        body = b'PK\x03\x04' + b'x' * 100
+        (self.outdir / 'takeout-20240101T000000Z-003.zip.part').write_bytes(body[:40])
+        response = fake_response(body[40:], status=206)
+        response.headers = {}
+        session = MagicMock()
+        session.get.return_value = response
+        outfile = download_file(session, "url", self.outdir, 3, "20240101T000000Z")
+        self.assertEqual(outfile.read_bytes(), body)
+
+    def test_interrupted_download_keeps_partial(self):
+        """Test a dropped connection leaves the received prefix for resuming."""
+        response = fake_response()
+        response.headers['content-length'] = '1000'
+        response.raw = DroppedStream(b'PKabc')
+        session = MagicMock()
+        session.get.return_value = response
+        with self.assertRaises(ConnectionError):
+            download_file(session, "url", self.outdir, 4, "20240101T000000Z")
+        self.assertEqual((self.outdir / 'takeout-20240101T000000Z-004.zip.part').read_bytes(), b'PKabc')
+
+    def test_other_exports_part_file_is_not_resumed(self):
+        """Test a part file from a different batch is never spliced in."""
+        (self.outdir / 'takeout-20231231T000000Z-003.zip.part').write_bytes(b'stale')
+        session = MagicMock()
+        session.get.return_value = fake_response()
+        outfile = download_file(session, "url", self.outdir, 3, "20240101T000000Z")
+        self.assertIsNone(session.get.call_args.kwargs['headers'])
+        self.assertEqual(outfile.read_bytes(), b'PK\x03\x04data')
+
+    def test_stop_keeps_partial(self):
+        """Test a stopped sequential download aborts and keeps the part file."""
+        stop = threading.Event()
+        response = fake_response()
+        response.headers['content-length'] = '1000'
+        response.raw = SlowStream(stop_after=3, stop=stop)
+        session = MagicMock()
+        session.get.return_value = response
+        with self.assertRaises(DownloadCancelled):
+            download_file(session, "url", self.outdir, 5, "20240101T000000Z", stop=stop)
+        part = self.outdir / 'takeout-20240101T000000Z-005.zip.part'
+        self.assertTrue(part.read_bytes().startswith(b'PK'))
+
+    @patch('download_takeout.time.sleep')
+    def test_rate_limit_honours_retry_after(self, mock_sleep):
+        """Test a 429 waits for Retry-After and then downloads."""
+        throttled = fake_response(b'', status=429)
+        throttled.headers['retry-after'] = '12'
+        session = MagicMock()
+        session.get.side_effect = [throttled, fake_response()]
+        outfile = download_file(session, "url", self.outdir, 2, "20240101T000000Z")
+        mock_sleep.assert_called_once_with(12.0)
+        self.assertTrue(outfile.exists())
+
+    @patch('download_takeout.time.sleep')
+    def test_retry_after_is_capped(self, mock_sleep):
+        """Test a huge Retry-After waits no longer than MAX_BACKOFF."""
+        throttled = fake_response(b'', status=429)
+        throttled.headers['retry-after'] = '86400'
+        session = MagicMock()
+        session.get.side_effect = [throttled, fake_response()]
+        download_file(session, "url", self.outdir, 2, "20240101T000000Z")
+        mock_sleep.assert_called_once_with(float(MAX_BACKOFF))
+
+    @patch('download_takeout.time.sleep')
+    def test_no_wait_after_last_rate_limited_attempt(self, mock_sleep):
+        """Test giving up on throttling does not sleep one last time."""
+        session = MagicMock()
+        session.get.side_effect = lambda *a, **k: fake_response(b'', status=429)
+        with self.assertRaises(IOError):
+            download_file(session, "url", self.outdir, 2, "20240101T000000Z", 1)
+        self.assertEqual(mock_sleep.call_count, session.get.call_count - 1)
+
+    @patch('download_takeout.RANGED_MIN_SIZE', 0)
+    def test_ranged_download_reassembles_archive(self):
+        """Test an archive split over several Range requests is reassembled."""
+        body = b'PK' + bytes(range(256)) * 40
+
+        def get(url, headers=None, **kwargs):
+            if headers and 'Range' in headers:
+                start, end = map(int, headers['Range'][len('bytes='):].split('-'))
+                return fake_response(body[start:end + 1], status=206)
+            response = fake_response(body)
+            response.headers['accept-ranges'] = 'bytes'
+            return response
+
+        session = MagicMock()
+        session.get.side_effect = get
+        outfile = download_file(session, "url", self.outdir, 1,
+                                "20240101T000000Z", connections=3)
+        self.assertEqual(outfile.read_bytes(), body)
+        self.assertEqual(session.get.call_count, 3)
+
+class TestCopyPipelined(unittest.TestCase):
+    def test_copies_multiple_chunks(self):
+        """Test data spanning several chunks arrives intact and in order."""
+        data = bytes(range(256)) * 12289
+        dst = io.BytesIO()
+        copy_pipelined(io.BytesIO(data), dst)
+        self.assertEqual(dst.getvalue(), data)
+
+    def test_write_error_is_raised(self):
+        """Test a failing disk write surfaces in the reading thread."""
+        dst = MagicMock()
+        dst.write.side_effect = OSError("disk full")
+        with self.assertRaises(OSError):
+            copy_pipelined(io.BytesIO(b'x' * (3 << 20)), dst)
+
+class TestFindNextMissingIndex(unittest.TestCase):
+    def test_stops_at_first_gap(self):
+        """Test archives finished out of order do not skip missing ones."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for index in (10, 11, 15):
+                (Path(tmpdir) / f'takeout-20240102T000000Z-{index:03d}.zip').touch()
+            self.assertEqual(find_next_missing_index(tmpdir, '20240102T000000Z', 10), 12)
+
+    def test_only_current_export_counts(self):
+        """Test archives of other exports and partial files are ignored."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('takeout-20240101T000000Z-003.zip',
+                         'takeout-20240102T000000Z-003.zip.part',
+                         'takeout-20240102T000000Z-.zip',
+                         'takeout-notes.zip',
+                         'readme.txt'):
+                (Path(tmpdir) / name).touch()
+            self.assertEqual(find_next_missing_index(tmpdir, '20240102T000000Z', 3), 3)
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        Path('curl.txt').write_text(
+            "curl 'https://takeout.google.com/download?rapt=r' -b 'SID=1'")
+        Path('secrets.json').write_text(json.dumps({
+            'google_takeout': {'output_directory': 'out', 'max_files': 4,
+                               'concurrent_downloads': 2},
+            'authentication': {'job_id': 'job', 'last_downloaded_index': 0},
+        }))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    @patch('download_takeout.atexit.register')
+    def test_ctrl_c_stops_running_downloads(self, _):
+        """Test SIGINT aborts transfers in flight and keeps their part files."""
+        def get(*args, **kwargs):
+            response = fake_response()
+            response.headers['content-length'] = str(10 ** 9)
+            response.raw = SlowStream()
+            return response
+
+        session = MagicMock()
+        session.get.side_effect = get
+        timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT))
+        began = time.monotonic()
+        with patch('download_takeout.create_session', return_value=session):
+            timer.start()
+            with self.assertRaises(KeyboardInterrupt):
+                main()
+        # Each stream would take five seconds to run dry on its own
+        self.assertLess(time.monotonic() - began, 2)
+        parts = sorted(p.name for p in Path('out').iterdir())
+        self.assertEqual(len(parts), 2)
+        self.assertTrue(all(name.endswith('.zip.part') for name in parts))
+
+    @patch('download_takeout.atexit.register')
+    @patch('download_takeout.refresh_download_token')
+    def test_rejected_archive_is_retried_after_refresh(self, mock_refresh, _):
+        """Test an auth failure refreshes once and retries the same index."""
+        def refresh():
+            # What token_retriever does: rewrite the job and refresh time
+            config = json.loads(Path('secrets.json').read_text())
+            config['authentication'].update(job_id='new-job', last_token_refresh=123)
+            Path('secrets.json').write_text(json.dumps(config))
+            return True
+
+        mock_refresh.side_effect = refresh
+        calls = []
+
+        def download(session, url, outdir, index, *args):
+            calls.append((index, url))
+            if index == 1 and [i for i, _ in calls].count(1) == 1:
+                raise AuthenticationError("Status 401")
+            return outdir / f"{index}.zip"
+
+        with patch('download_takeout.download_file', side_effect=download):
+            self.assertEqual(main(), 0)
+        mock_refresh.assert_called_once()
+        retried = [url for index, url in calls if index == 1]
+        self.assertEqual(len(retried), 2)
+        self.assertIn('j=new-job', retried[-1])
+        config = json.loads(Path('secrets.json').read_text())
+        self.assertEqual(config['authentication']['last_downloaded_index'], 4)
+        self.assertEqual(config['authentication']['job_id'], 'new-job')
+        self.assertEqual(config['authentication']['last_token_refresh'], 123)
+
+class TestSaveConfig(unittest.TestCase):
+    def test_save_replaces_file_atomically(self):
+        """Test config is written in full and no temp file is left behind."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'secrets.json'
+            path.write_text('{"stale": true}')
+            save_config({'authentication': {'last_downloaded_index': 8}}, str(path))
+            self.assertEqual(json.loads(path.read_text()),
+                             {'authentication': {'last_downloaded_index': 8}})
+            self.assertEqual([p.name for p in Path(tmpdir).iterdir()], ['secrets.json'])
+
+    def test_save_is_human_readable(self):
+        """Test the saved config stays indented for hand editing."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'secrets.json'
+            save_config({'authentication': {'last_downloaded_index': 8}}, str(path))
+            self.assertIn('\n  ', path.read_text())
+
 if __name__ == '__main__':
     unittest.main()
 
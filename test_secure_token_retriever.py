@@ -44,6 +44,44 @@ def test_keyring_fallback(mock_keyring, token_retriever):
     assert token_retriever.email is not None
     assert token_retriever.password is not None
 
+@patch('keyring.get_password')
+def test_keyring_bundle_lookup(mock_keyring, mock_config, tmp_path):
+    """Test bundled credentials need no per-key lookups"""
+    bundle = json.dumps({
+        'email': 'bundled@example.com',
+        'password': 'bundled_password'
+    })
+    mock_keyring.side_effect = lambda service, key: bundle if key == 'credentials' else None
+    config_path = tmp_path / 'secrets.json'
+    with open(config_path, 'w') as f:
+        json.dump(mock_config, f)
+
+    retriever = SecureTokenRetriever(config_path=str(config_path))
+
+    looked_up = [call.args[1] for call in mock_keyring.call_args_list]
+    assert looked_up == ['credentials', 'two_factor_secret']
+    assert retriever.email == 'bundled@example.com'
+    assert retriever.password == 'bundled_password'
+    # Not in the bundle or keyring, so taken from the configuration file
+    assert retriever.two_factor_secret == mock_config['google_takeout']['two_factor_secret']
+
+@patch('keyring.get_password')
+def test_keyring_per_key_entry_fills_bundle_gaps(mock_keyring, mock_config, tmp_path):
+    """Test an older per-key entry is used for a key missing from the bundle"""
+    entries = {
+        'credentials': json.dumps({'email': 'bundled@example.com'}),
+        'password': 'legacy_password',
+    }
+    mock_keyring.side_effect = lambda service, key: entries.get(key)
+    config_path = tmp_path / 'secrets.json'
+    with open(config_path, 'w') as f:
+        json.dump(mock_config, f)
+
+    retriever = SecureTokenRetriever(config_path=str(config_path))
+
+    assert retriever.email == 'bundled@example.com'
+    assert retriever.password == 'legacy_password'
+
 @patch('selenium.webdriver.Chrome')
 def test_webdriver_setup(mock_chrome, token_retriever):
     """Test WebDriver setup with mocked Chrome"""
@@ -68,7 +106,7 @@ def test_config_save(token_retriever, tmp_path):
     assert 'google_takeout' in saved_config
 
 @patch('selenium.webdriver.Chrome')
-def test_token_retrieval_flow(mock_chrome, token_retriever, tmp_path):
+def test_token_retrieval_flow(mock_chrome, token_retriever, tmp_path, monkeypatch):
     """
     Simulate a complete token retrieval flow
     Note: This is a mock test and would need significant 
@@ -80,6 +118,9 @@ def test_token_retrieval_flow(mock_chrome, token_retriever, tmp_path):
     
     # Configure mock driver to simulate successful flow
     mock_driver.current_url = "https://takeout.google.com/settings/takeout?j=test_job_123"
+    mock_driver.find_element.return_value.is_displayed.return_value = True
+    # curl.txt is written to the working directory
+    monkeypatch.chdir(tmp_path)
     
     try:
         result = token_retriever.retrieve_takeout_token()
@@ -107,7 +148,7 @@ def test_authentication_failure_handling(mock_chrome, token_retriever):
     mock_chrome.return_value = mock_driver
     
     # Simulate various failure scenarios
-    mock_driver.side_effect = Exception("Authentication Failed")
+    mock_driver.get.side_effect = Exception("Authentication Failed")
     
     with pytest.raises(Exception):
         token_retriever.retrieve_takeout_token()
@@ -0,0 +1,89 @@
+import json
+import logging
+import time
+import pytest
+from unittest.mock import patch
+
+import token_retriever
+from download_takeout import parse_curl
+from token_retriever import build_curl_command, get_chrome_version, preflight, retrieve_token
+
+
+class PreflightReached(Exception):
+    """Raised by the patched preflight once retrieval goes past the TTL gate"""
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a scratch directory holding a freshly refreshed secrets.json"""
+    monkeypatch.chdir(tmp_path)
+    config = {
+        'google_takeout': {'email': 'test@example.com', 'password': 'secret'},
+        'authentication': {'job_id': 'job', 'last_token_refresh': time.time()},
+    }
+    (tmp_path / 'secrets.json').write_text(json.dumps(config))
+    (tmp_path / 'curl.txt').write_text('curl')
+    with patch('token_retriever.setup_logging', return_value=logging.getLogger(__name__)), \
+            patch('token_retriever.preflight', side_effect=PreflightReached) as mock_preflight:
+        yield tmp_path, mock_preflight
+
+
+def test_fresh_token_skips_retrieval(workdir):
+    """A recent refresh with curl.txt on disk never reaches the browser"""
+    _, mock_preflight = workdir
+    retrieve_token()
+    mock_preflight.assert_not_called()
+
+
+def test_force_ignores_fresh_token(workdir):
+    """--force runs the browser flow however fresh the token is"""
+    with pytest.raises(PreflightReached):
+        retrieve_token(force=True)
+
+
+def test_missing_curl_file_forces_retrieval(workdir):
+    """A fresh token is useless without the curl.txt it belongs to"""
+    tmp_path, _ = workdir
+    (tmp_path / 'curl.txt').unlink()
+    with pytest.raises(PreflightReached):
+        retrieve_token()
+
+
+def test_preflight_rejects_blank_password():
+    """An empty password fails before Chrome is launched"""
+    config = {
+        'google_takeout': {'email': 'test@example.com', 'password': ''},
+        'authentication': {},
+    }
+    with pytest.raises(KeyError):
+        preflight(config)
+
+
+def test_chrome_version_read_from_last_version_file(tmp_path, monkeypatch):
+    """The profile's Last Version file answers without running the browser"""
+    version_file = tmp_path / 'Last Version'
+    version_file.write_text('126.0.6478.126')
+    monkeypatch.setattr(token_retriever, '_VERSION_FILES', [str(version_file)])
+    with patch('token_retriever.subprocess.run') as mock_run:
+        assert get_chrome_version() == '126.0.6478.126'
+    mock_run.assert_not_called()
+
+
+def test_curl_command_round_trips_through_parse_curl():
+    """download_takeout must read back exactly what the retriever writes"""
+    headers = {
+        'User-Agent': "Mozilla/5.0 (X11; it's quoted)",
+        'Accept-Language': 'en-US,en;q=0.9',
+    }
+    cookies = [
+        {'name': 'SID', 'value': 'abc=def'},
+        {'name': 'HSID', 'value': 'x y "z"'},
+    ]
+    command = build_curl_command('job-123', 'rapt-456', headers, cookies)
+
+    parsed_headers, parsed_cookies, rapt = parse_curl(command)
+
+    assert rapt == 'rapt-456'
+    for name, value in headers.items():
+        assert parsed_headers[name] == value
+    assert parsed_cookies == {'SID': 'abc=def', 'HSID': 'x y "z"'}
@@ -2,31 +2,88 @@
 
 import os
 import sys
-import json
 import time
 import logging
+import logging.handlers
 import traceback
+import atexit
+import queue
+import shutil
 import subprocess
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 import re
+import shlex
+import argparse
+
+import json_config
+
+# Chrome version number and the Takeout job id in the download URL
+_CHROME_VER_RE = re.compile(r'\d+\.\d+\.\d+\.\d+')
+_JOB_ID_RE = re.compile(r'j=([^&]+)')
+_RAPT_RE = re.compile(r'rapt=([^&]+)')
+
+# Persistent profile so the Google session cookie survives between runs
+PROFILE_DIR = os.path.expanduser('~/.cache/takeout-chrome-profile')
+
+# Chrome records its version here on every start, so reading the file avoids
+# launching the browser just to ask it. The token browser runs in its own
+# profile, so that copy is the one kept current; the default profiles are
+# only a fallback before the first run.
+_VERSION_FILES = [
+    os.path.join(PROFILE_DIR, 'Last Version'),
+    '~/.config/google-chrome/Last Version',
+    '~/.config/chromium/Last Version',
+]
+# Binary names Chrome and Chromium install under across distributions
+CHROME_BINARIES = ('chromium-browser', 'chromium', 'google-chrome', 'google-chrome-stable')
+
+TAKEOUT_URL = "https://takeout.google.com/settings/takeout"
+
+# Seconds a retrieved token is trusted before the browser flow runs again
+TOKEN_TTL = 3600
+
+# Fill a login field and press its Next button in a single round trip
+_FILL_AND_SUBMIT_SCRIPT = (
+    "arguments[0].value = arguments[1];"
+    "arguments[0].dispatchEvent(new Event('input', {bubbles: true}));"
+    "arguments[2].click();"
+)
+
+# Collect every named meta tag in one round trip instead of 1 + 2N RPCs
+_META_SCRIPT = (
+    "return Array.from(document.querySelectorAll('meta[name]'))"
+    ".map(m => [m.name, m.getAttribute('content') || m.content]);"
+)
 
 def setup_logging():
-    """Configure comprehensive logging"""
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('token_retriever.log'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    """
+    Configure comprehensive logging
+
+    Records are queued and written by a background listener thread, so file
+    and console I/O never stalls the browser flow.
+    """
+    root = logging.getLogger()
+    # Already set up by an earlier call; a second listener would log twice
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return logging.getLogger(__name__)
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.FileHandler('token_retriever.log'),
+        logging.StreamHandler(sys.stdout)
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    # Drain anything still queued before the interpreter exits
+    atexit.register(listener.stop)
+
+    # Not basicConfig: it would give the queue handler a second formatter
+    root.setLevel(logging.DEBUG)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
     return logging.getLogger(__name__)
 
 def get_chrome_version():
@@ -35,61 +92,94 @@ def get_chrome_version():
     
     :return: Version string
     """
-    try:
-        # Try Chromium browser first
-        version_output = subprocess.check_output(
-            ["chromium-browser", "--version"], 
-            text=True
-        ).strip()
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    for version_file in _VERSION_FILES:
+        try:
+            with open(os.path.expanduser(version_file)) as f:
+                version_match = _CHROME_VER_RE.search(f.read())
+        except OSError:
+            continue
+        if version_match:
+            return version_match.group(0)
+
+    # The browser must not wait on our stdin
+    run_args = dict(check=True, capture_output=True, text=True,
+                    stdin=subprocess.DEVNULL)
+    for binary in CHROME_BINARIES:
         try:
-            # Fallback to Google Chrome
-            version_output = subprocess.check_output(
-                ["google-chrome", "--version"], 
-                text=True
-            ).strip()
+            version_output = subprocess.run(
+                [binary, "--version"], **run_args
+            ).stdout.strip()
+            break
         except (subprocess.CalledProcessError, FileNotFoundError):
-            raise RuntimeError("No Chrome/Chromium browser found")
+            continue
+    else:
+        raise RuntimeError("No Chrome/Chromium browser found")
     
     # Extract version number
-    version_match = re.search(r'\d+\.\d+\.\d+\.\d+', version_output)
+    version_match = _CHROME_VER_RE.search(version_output)
     if not version_match:
         raise RuntimeError(f"Could not parse version from: {version_output}")
     
     return version_match.group(0)
 
-def setup_webdriver():
+def setup_webdriver(config=None):
     """
     Set up WebDriver with comprehensive options
     
+    :param config: Optional configuration; chromedriver_path overrides the
+                   driver Selenium Manager would pick
     :return: Configured Chrome WebDriver
     """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    
     logger = logging.getLogger(__name__)
     
     # Chrome options
     chrome_options = Options()
     
-    # Disable headless mode for debugging
-    # chrome_options.add_argument("--headless")  # Commented out
+    # The flow only fills forms and clicks a button, so nothing needs drawing
+    chrome_options.add_argument("--headless=new")
     
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument(f"--user-data-dir={PROFILE_DIR}")
+    
+    # Skip images and background services that only slow page loads
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-sync")
+    chrome_options.add_argument("--disable-features=Translate,MediaRouter")
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    
+    # Return from driver.get at DOMContentLoaded rather than the full load
+    chrome_options.page_load_strategy = 'eager'
     
     # Add additional chrome options to resolve DevTools issue
     chrome_options.add_argument("--remote-debugging-port=9222")
     
     try:
-        # Get the current Chromium version
-        chrome_version = get_chrome_version()
-        logger.info(f"Detected Chromium version: {chrome_version}")
-        
-        # Setup WebDriver 
-        service = Service(ChromeDriverManager().install())
+        # The version only feeds this log line; Selenium Manager resolves the
+        # browser itself, so a failed probe must not stop the launch
+        try:
+            logger.info("Detected Chromium version: %s", get_chrome_version())
+        except RuntimeError as e:
+            logger.warning("Could not detect Chromium version: %s", e)
         
-        # Create WebDriver
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        # Selenium Manager finds and caches a matching driver itself; only
+        # build a Service when the user pinned a specific binary
+        driver_path = (config or {}).get('chromedriver_path')
+        if driver_path:
+            driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+        else:
+            driver = webdriver.Chrome(options=chrome_options)
         
         # Set comprehensive timeouts
         driver.set_page_load_timeout(30)  # 30 seconds page load
@@ -99,21 +189,79 @@ def setup_webdriver():
         return driver
     
     except Exception as e:
-        logger.error(f"WebDriver setup failed: {e}")
+        logger.error("WebDriver setup failed: %s", e)
         logger.error(traceback.format_exc())
         raise
 
-def retrieve_token():
+def build_curl_command(job_id, rapt, headers, cookies):
+    """
+    Build the curl.txt command download_takeout replays the browser session from
+
+    Every argument is shell-quoted; header and cookie values are not ours
+    to trust.
+
+    :param job_id: Takeout job id
+    :param rapt: rapt token from the download URL, or None
+    :param headers: Header name to value mapping
+    :param cookies: Browser cookies as returned by driver.get_cookies()
+    :return: curl command line
+    """
+    url = f"https://takeout.google.com/settings/takeout/download?i=0&j={job_id}&download=true"
+    if rapt:
+        url += f"&rapt={rapt}"
+    args = ['curl', url]
+    for name, value in headers.items():
+        args += ['-H', f"{name}: {value}"]
+    args += ['-b', "; ".join(f"{c['name']}={c['value']}" for c in cookies)]
+    return shlex.join(args)
+
+def preflight(config):
+    """
+    Check everything the browser flow needs before paying for a Chrome launch
+    
+    :param config: Loaded secrets.json configuration
+    :raises KeyError: If credentials or the authentication section are missing
+    :raises RuntimeError: If no Chrome/Chromium binary is installed
+    """
+    credentials = config.get('google_takeout', {})
+    for key in ('email', 'password'):
+        if not credentials.get(key):
+            raise KeyError(f"google_takeout.{key} is not set in secrets.json")
+    if 'authentication' not in config:
+        raise KeyError("authentication section is missing from secrets.json")
+    
+    if not any(shutil.which(name) for name in CHROME_BINARIES):
+        raise RuntimeError("No Chrome/Chromium browser found")
+
+def retrieve_token(force=False):
     """
     Comprehensive token retrieval process
+    
+    :param force: Run the browser flow even if the saved token is still fresh
     """
     logger = setup_logging()
     driver = None
     
     try:
         # Load secrets
-        with open('secrets.json', 'r') as f:
-            config = json.load(f)
+        config = json_config.load_config('secrets.json')
+        
+        # Skip the whole browser flow while the last token is still fresh
+        auth = config.get('authentication', {})
+        age = time.time() - (auth.get('last_token_refresh') or 0)
+        if (not force and age < auth.get('token_ttl_seconds', TOKEN_TTL)
+                and os.path.exists('curl.txt')):
+            logger.info("Download token refreshed %.0fs ago; skipping retrieval", age)
+            return
+        
+        # Fail before launching Chrome if the run cannot succeed
+        preflight(config)
+        
+        # Selenium takes a noticeable share of startup to import, so only
+        # load it once the browser flow is really going to run
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
         
         # Extract credentials
         email = config['google_takeout']['email']
@@ -122,35 +270,55 @@ def retrieve_token():
         logger.info("Starting token retrieval process")
         
         # Setup WebDriver
-        driver = setup_webdriver()
+        driver = setup_webdriver(config)
         
-        # Navigate to Google login
-        logger.info("Navigating to Google login")
-        driver.get("https://accounts.google.com/signin/v2/identifier")
+        # One wait object per timeout, shared by every step that uses it
+        login_wait = WebDriverWait(driver, 10, poll_frequency=0.05)
+        page_wait = WebDriverWait(driver, 30, poll_frequency=0.05)
         
-        # Wait and enter email
-        logger.info("Entering email")
-        email_input = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "identifierId"))
-        )
-        email_input.send_keys(email)
-        driver.find_element(By.ID, "identifierNext").click()
-        
-        # Wait and enter password
-        logger.info("Entering password")
-        password_input = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.NAME, "Passwd"))
-        )
-        password_input.send_keys(password)
-        driver.find_element(By.ID, "passwordNext").click()
-        
-        # Navigate to Takeout
+        # A saved profile session lands straight on Takeout; only sign in
+        # when Google bounces us to the accounts page
         logger.info("Navigating to Google Takeout")
-        driver.get("https://takeout.google.com/settings/takeout")
+        driver.get(TAKEOUT_URL)
+        
+        if "accounts.google.com" in driver.current_url:
+            # Navigate to Google login
+            logger.info("Navigating to Google login")
+            driver.get("https://accounts.google.com/signin/v2/identifier")
+            
+            # Wait and enter email
+            logger.info("Entering email")
+            # Wait for the field and its Next button together so the script
+            # never clicks a button that has not rendered yet
+            email_input, email_next = login_wait.until(EC.all_of(
+                EC.presence_of_element_located((By.ID, "identifierId")),
+                EC.element_to_be_clickable((By.ID, "identifierNext"))
+            ))
+            driver.execute_script(_FILL_AND_SUBMIT_SCRIPT, email_input, email, email_next)
+            
+            # Wait and enter password
+            logger.info("Entering password")
+            password_input, password_next = login_wait.until(EC.all_of(
+                EC.presence_of_element_located((By.NAME, "Passwd")),
+                EC.element_to_be_clickable((By.ID, "passwordNext"))
+            ))
+            driver.execute_script(_FILL_AND_SUBMIT_SCRIPT, password_input, password, password_next)
+            
+            # With eager page loads nothing blocks on sign-in finishing, so
+            # wait for the password page to go away before leaving it
+            page_wait.until(
+                EC.staleness_of(password_input)
+            )
+            
+            logger.info("Returning to Google Takeout")
+            driver.get(TAKEOUT_URL)
+        else:
+            logger.info("Reusing signed-in browser profile")
         
         # Wait for download button
         logger.info("Waiting for download button")
-        download_button = WebDriverWait(driver, 30).until(
+        # Takeout can be slow to build the page server-side, so keep 30 s here
+        download_button = page_wait.until(
             EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Download')]"))
         )
         download_button.click()
@@ -160,35 +328,30 @@ def retrieve_token():
         current_url = driver.current_url
         
         # Extract job ID
-        job_id_match = re.search(r'j=([^&]+)', current_url)
+        job_id_match = _JOB_ID_RE.search(current_url)
         job_id = job_id_match.group(1) if job_id_match else None
+        rapt_match = _RAPT_RE.search(current_url)
+        rapt = rapt_match.group(1) if rapt_match else None
         
         # Prepare cURL command
-        headers = {h.get_attribute('name'): h.get_attribute('value') 
-                   for h in driver.find_elements(By.XPATH, "//meta[@name]")}
-        
-        curl_command = (
-            f"curl 'https://takeout.google.com/settings/takeout/download?i=0&j={job_id}&download=true' "
-            + " ".join([f"-H '{k}: {v}'" for k, v in headers.items()])
-        )
+        headers = dict(driver.execute_script(_META_SCRIPT))
+        curl_command = build_curl_command(job_id, rapt, headers, driver.get_cookies())
         
         # Save cURL command
-        with open('curl.txt', 'w') as f:
-            f.write(curl_command)
+        json_config.write_atomic('curl.txt', curl_command.encode('utf-8'), mode=0o600)
         
         # Update configuration
         config['authentication']['job_id'] = job_id
         config['authentication']['last_token_refresh'] = time.time()
         
         # Save updated configuration
-        with open('secrets.json', 'w') as f:
-            json.dump(config, f, indent=4)
+        json_config.save_config(config, 'secrets.json', pretty=True)
         
-        logger.info(f"Successfully retrieved download token for job {job_id}")
+        logger.info("Successfully retrieved download token for job %s", job_id)
         print(f"Download token retrieved for job {job_id}")
     
     except Exception as e:
-        logger.error(f"Token retrieval failed: {e}")
+        logger.error("Token retrieval failed: %s", e)
         logger.error(traceback.format_exc())
         print(f"Error: {e}")
         raise
@@ -199,8 +362,13 @@ def retrieve_token():
             driver.quit()
 
 def main():
+    parser = argparse.ArgumentParser(description="Retrieve a Google Takeout download token")
+    parser.add_argument('--force', action='store_true',
+                        help="Refresh even if the saved token is still fresh")
+    args = parser.parse_args()
+    
     try:
-        retrieve_token()
+        retrieve_token(force=args.force)
     except Exception as e:
         sys.exit(1)
 